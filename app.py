@@ -1,18 +1,21 @@
 # Import modules --------------------------------------------------------------
 import datetime
-import json
+import orjson  # fast JSON parsing
+import ijson  # streaming JSON parsing
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import sqlite3  # database
+from concurrent.futures import ThreadPoolExecutor  # concurrent API calls
+import threading
+import time
+from collections import deque, OrderedDict
 import os  # file handling
-import glob
-import shutil  # file handling
+import io
+import hashlib  # keys for repeated uploads and plots
 import pandas as pd  # data handling
 import numpy as np
-import mplfinance as mpf  # showing candle plots
-import matplotlib
-import matplotlib.pyplot as plt
-import seaborn as sns
-from flask import Flask, request, send_file, render_template
+from flask import Flask, request, send_file, render_template, g
 
 
 # API keys --------------------------------------------------------------------
@@ -25,103 +28,297 @@ POLYGON_API_KEY = secrets.POLYGON_API_KEY  # polygon.io
 
 # Set up SQL DB ---------------------------------------------------------------
 DB = "db.sqlite"
-conn = sqlite3.connect(DB)
-conn.execute("PRAGMA foreign_keys = 1")
 
-# Set up cache file for News --------------------------------------------------
-NEWS_CACHE = "cached_news.json"
 
+def connect_db(db: str):
+    """Open a connection to the database and tune it for many small writes
 
-# Change matplotlib to backend mode -------------------------------------------
-matplotlib.use('Agg')
-
+    Parameters
+    ----------
+    db : str
+        path to the database file
 
-# Helper Functions (General) --------------------------------------------------
-def make_request(baseurl: str, params: dict):
-    '''Make a request to the Web API
+    Returns
+    -------
+    sqlite3.Connection
+        connection to database
+    """
+    # keep enough compiled statements around for every per-table insert
+    conn = sqlite3.connect(db, cached_statements=256)
+    # WAL lets readers and the writer proceed concurrently,
+    # and synchronous=NORMAL is safe with WAL (fewer fsyncs per commit)
+    conn.executescript("""
+        PRAGMA foreign_keys = 1;
+        PRAGMA journal_mode = WAL;
+        PRAGMA synchronous = NORMAL;
+        PRAGMA temp_store = MEMORY;
+        PRAGMA mmap_size = 268435456;
+        PRAGMA cache_size = -65536;
+    """)
+    return conn
+
+
+def init_schema(conn):
+    '''Generate all the tables (and indexes) in the database if not exist
 
     Parameters
     ----------
-    baseurl: str
-        The URL for the API endpoint
-    params: dict
-        A dictionary of param:value pairs
+    conn
+        connection to database
 
     Returns
     -------
-    dict
-        the data returned from making the request
+    None
     '''
-    response = requests.get(baseurl, params=params)
-    return response.json()
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS "Rates" (
+            "Currency" TEXT NOT NULL,
+            "Date" NUMERIC NOT NULL,
+            "Rate" REAL NOT NULL,
+            PRIMARY KEY("Currency", "Date")
+        );
+        CREATE TABLE IF NOT EXISTS "ETFs"(
+            "Symbol" TEXT PRIMARY KEY UNIQUE,
+            "Name" TEXT,
+            "Exchange" TEXT,
+            "LastUpdate" NUMERIC
+        );
+        CREATE TABLE IF NOT EXISTS "Companies" (
+            "Symbol" TEXT PRIMARY KEY UNIQUE,
+            "Name" TEXT,
+            "Exchange" TEXT
+        );
+        CREATE TABLE IF NOT EXISTS "EPS" (
+            "Symbol" TEXT PRIMARY KEY UNIQUE,
+            "EPS1Date" NUMERIC,
+            "EPS1Reported" REAL,
+            "EPS1Expected" REAL,
+            "EPS2Date" NUMERIC,
+            "EPS2Reported" REAL,
+            "EPS2Expected" REAL,
+            "EPS3Date" NUMERIC,
+            "EPS3Reported" REAL,
+            "EPS3Expected" REAL,
+            "EPS4Date" NUMERIC,
+            "EPS4Reported" REAL,
+            "EPS4Expected" REAL,
+            "LastUpdate" NUMERIC,
+            FOREIGN KEY(Symbol)
+                REFERENCES Companies(Symbol)
+        );
+        CREATE INDEX IF NOT EXISTS "ix_EPS_LastUpdate"
+            ON "EPS"("LastUpdate");
+        CREATE TABLE IF NOT EXISTS "History" (
+            "Date" NUMERIC NOT NULL,
+            "Symbol" TEXT NOT NULL,
+            "Open" REAL,
+            "High" REAL,
+            "Low" REAL,
+            "Close" REAL,
+            "Volume" REAL,
+            "AdjustedClose" REAL,
+            "Ratio" REAL,
+            PRIMARY KEY("Symbol", "Date")
+        );
+        CREATE TABLE IF NOT EXISTS "News" (
+            "Symbol" TEXT PRIMARY KEY UNIQUE,
+            "Fetched" NUMERIC,
+            "Payload" TEXT
+        );
+    ''')
+
+
+conn = connect_db(DB)
+init_schema(conn)
+
+# Set up HTTP session ---------------------------------------------------------
+# reuse TCP/TLS connections to the API hosts across calls (keep-alive)
+SESSION = requests.Session()
+SESSION.mount("https://",
+              HTTPAdapter(pool_connections=8,
+                          pool_maxsize=32,
+                          max_retries=Retry(total=3, backoff_factor=0.3)))
+
+# keep successful responses on disk, so that they survive restarts
+# (a separate file, so it never waits on a transaction in DB)
+HTTP_CACHE = "http_cache.sqlite"
+with sqlite3.connect(HTTP_CACHE) as cache:
+    cache.execute("""
+        CREATE TABLE IF NOT EXISTS "Responses" (
+            "Key" TEXT PRIMARY KEY UNIQUE,
+            "Fetched" REAL,
+            "Payload" BLOB
+        );
+    """)
+cache.close()
+
 
+# Plotting modules ------------------------------------------------------------
+# matplotlib and mplfinance are imported on the first plot,
+# so pages without plots (and server start) never load them
+mpf = None
+# figures reused by every plot of the kind, instead of a new one per request
+# (drawing on them is not thread-safe, so one plot at a time)
+CUM_FIG = CUM_AX = EPS_FIG = EPS_AX = None
+PLOT_LOCK = threading.Lock()
 
-def open_cache(filename: str):
-    ''' Opens the cache file if it exists and loads the JSON
-    if the cache file doesn't exist, creates a new cache dictionary
+
+def load_plotting():
+    """Import the plotting modules and create the reused figures,
+       once on first use (call before taking PLOT_LOCK)
 
     Parameters
     ----------
-    filename: str
-        filename for the cache
+    None
 
     Returns
     -------
-    dict
-        The opened cache
-    '''
-    try:
-        with open(filename, 'r') as fobj:
-            cache_dict = json.load(fobj)
-    except FileNotFoundError:
-        cache_dict = {}
-    return cache_dict
+    None
+    """
+    global mpf, CUM_FIG, CUM_AX, EPS_FIG, EPS_AX
+    with PLOT_LOCK:
+        if mpf is not None:
+            return
+        # change matplotlib to backend mode
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        import mplfinance  # showing candle plots
+        CUM_FIG, CUM_AX = plt.subplots()
+        EPS_FIG, EPS_AX = plt.subplots()
+        mpf = mplfinance
+
+
+# Helper Functions (General) --------------------------------------------------
+# tables that may be named in a statement (identifiers cannot be bound)
+TABLES = {"Rates", "ETFs", "Companies", "EPS", "History", "News"}
+
+
+def check_table_name(tablename: str):
+    """Make sure the table name is one of our tables before it is
+       formatted into a SQL statement
+
+    Parameters
+    ----------
+    tablename : str
+        table to be checked
+
+    Returns
+    -------
+    None
+    """
+    if tablename not in TABLES:
+        raise ValueError(f"Unknown table: {tablename}")
+
+
+# params that are not part of a cache key
+CREDENTIALS = {"app_id", "apikey", "apiKey"}
+# keys of the error messages returned with status 200
+# (ex. {"Note": "...API call frequency..."} when API call limit reached)
+ERROR_KEYS = {"Note", "Information", "Error Message"}
+
+
+# Alpha Vantage allows 5 API calls per minute
+ALPHA_URL = "https://www.alphavantage.co/query"
+ALPHA_CALLS = deque(maxlen=5)
+ALPHA_LOCK = threading.Lock()
 
 
-def save_cache(cache_dict: dict, filename: str):
-    ''' Saves the current state of the cache to disk
+def wait_for_alpha_vantage():
+    '''Sleep until another Alpha Vantage API call is allowed
 
     Parameters
     ----------
-    cache_dict: dict
-        The dictionary to save
-    filename: str
-        filename for the cache
+    None
 
     Returns
     -------
     None
     '''
-    with open(filename, 'w') as fobj:
-        json.dump(cache_dict, fobj, indent=4)
+    with ALPHA_LOCK:
+        # the oldest of the last 5 calls must be a minute old
+        if len(ALPHA_CALLS) == ALPHA_CALLS.maxlen:
+            wait = 60 - (time.monotonic() - ALPHA_CALLS[0])
+            if wait > 0:
+                time.sleep(wait)
+        ALPHA_CALLS.append(time.monotonic())
 
 
-def check_table_exist(conn, tablename: str):
-    """Check if a table with the same name already exists in the database
+def make_request(baseurl: str, params: dict, ttl: int = 0):
+    '''Make a request to the Web API
 
     Parameters
     ----------
-    conn
-        connection to database
-    tablename : str
-        table to be checked if it exists
+    baseurl: str
+        The URL for the API endpoint
+    params: dict
+        A dictionary of param:value pairs
+    ttl: int
+        seconds a response on disk is reused for (if 0, not cached)
 
     Returns
     -------
-    bool
-        True if it exists
-    """
-    cur = conn.cursor()
-    statement = f"""
-        SELECT count(name)
-        FROM sqlite_master
-        WHERE type ='table' AND name = '{tablename}';
-    """
-    cur.execute(statement)
-    if cur.fetchone()[0] == 1:
-        return True
-    else:
-        return False
+    dict
+        the data returned from making the request
+    '''
+    if not ttl:
+        if baseurl == ALPHA_URL:
+            wait_for_alpha_vantage()
+        response = SESSION.get(baseurl, params=params, timeout=10)
+        return orjson.loads(response.content)
+    key = baseurl + "?" + "&".join(
+        f"{k}={v}" for k, v in sorted(params.items()) if k not in CREDENTIALS)
+    # a connection per call, as API calls may run in other threads
+    cache = sqlite3.connect(HTTP_CACHE)
+    try:
+        statement = """
+            SELECT Payload
+            FROM Responses
+            WHERE Key = ? AND Fetched > ?;
+        """
+        record = cache.execute(statement, [key, time.time() - ttl]).fetchone()
+        # if cached recently enough
+        if record is not None:
+            return orjson.loads(record[0])
+        # only calls that reach the API count against its limit
+        if baseurl == ALPHA_URL:
+            wait_for_alpha_vantage()
+        response = SESSION.get(baseurl, params=params, timeout=10)
+        data = orjson.loads(response.content)
+        # never keep error messages
+        if response.ok and not (isinstance(data, dict)
+                                and ERROR_KEYS & data.keys()):
+            statement = """
+                INSERT OR REPLACE INTO "Responses"
+                VALUES (?, ?, ?)
+            """
+            with cache:
+                cache.execute(statement, [key, time.time(), response.content])
+        return data
+    finally:
+        cache.close()
+
+
+def fetch_many(func, args: list, max_workers: int = 8):
+    '''Call an API-fetching function for many arguments concurrently
+       (the calls are I/O-bound, so their network latency overlaps)
+
+    Parameters
+    ----------
+    func
+        function making one API call for one argument
+    args: list
+        arguments to call the function with
+    max_workers: int
+        maximum number of API calls in flight at once
+
+    Returns
+    -------
+    list
+        the data returned for each argument, in the same order
+    '''
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(func, args))
 
 
 def load_table_as_pd(conn, tablename: str):
@@ -140,102 +337,129 @@ def load_table_as_pd(conn, tablename: str):
         dataframe converted from a table in SQL DB
     """
     # get table as a pandas dataframe
+    check_table_name(tablename)
     statement = f"""
         SELECT *
-        FROM '{tablename}';
+        FROM "{tablename}";
     """
     df = pd.read_sql_query(statement, conn)
     return df
 
 
-# Exchange Rates --------------------------------------------------------------
-def gen_table_for_currency(conn, currency: str):
-    '''Generate a table of the currency in the database if not exist
+def load_record_as_pd(conn, tablename: str, symbol: str):
+    """Load records of the symbol in a table as a pandas DataFrame
 
     Parameters
     ----------
     conn
         connection to database
-    currency: str
-        currency of choice
+    tablename : str
+        table to be loaded
+    symbol : str
+        ticker symbol of the records
 
     Returns
     -------
-    None
-    '''
-    cur = conn.cursor()
-    statement = f'''
-        CREATE TABLE IF NOT EXISTS "Rates{currency}" (
-            "Date" NUMERIC PRIMARY KEY UNIQUE,
-            "Rates" REAL NOT NULL
-        );
-    '''
-    cur.execute(statement)
+    pd.DataFrame
+        dataframe containing only the records of the symbol
+    """
+    check_table_name(tablename)
+    statement = f"""
+        SELECT *
+        FROM "{tablename}"
+        WHERE Symbol = ?;
+    """
+    df = pd.read_sql_query(statement, conn, params=[symbol])
+    return df
 
 
-def load_table_currency(conn, currency: str):
-    """Load a table of the curency in the database as a pandas DataFrame
+# plots saved in '/images', least recently used first
+PLOT_PREFIXES = ("cumulative", "eps", "history")
+MAX_PLOTS = 64
+PLOT_LRU = OrderedDict()
+# pick up the plots saved before a restart (one directory scan)
+with os.scandir("images") as entries:
+    for entry in sorted(entries, key=lambda e: e.stat().st_mtime):
+        if entry.name.startswith(PLOT_PREFIXES):
+            PLOT_LRU[entry.name] = None
+PLOT_LRU_LOCK = threading.Lock()
+
+
+def register_plot(filename: str):
+    """Mark the plot as the most recently used one, and remove
+       the least recently used plots beyond MAX_PLOTS
 
     Parameters
     ----------
-    conn
-        connection to database
-    currency : str
-        currency of choice
+    filename : str
+        filename of the plot in '/images'
 
     Returns
     -------
-    pd.DataFrame
-        dataframe converted from a table
+    None
     """
-    # if there is no such table, generate new one
-    if not check_table_exist(conn, f"Rates{currency}"):
-        gen_table_for_currency(conn, currency)
-    # get table as a pandas dataframe
-    statement = f"""
-        SELECT *
-        FROM 'Rates{currency}';
+    with PLOT_LRU_LOCK:
+        PLOT_LRU[filename] = None
+        PLOT_LRU.move_to_end(filename)
+        while len(PLOT_LRU) > MAX_PLOTS:
+            old, _ = PLOT_LRU.popitem(last=False)
+            try:
+                os.remove(f"images/{old}")
+            except FileNotFoundError:
+                pass
+
+
+def gen_plot_filename(prefix: str, df):
+    """Generate a filename for a plot of the data, which changes only
+       when the data changes (so an existing plot can be reused)
+
+    Parameters
+    ----------
+    prefix : str
+        beginning of the filename (ex. "eps-AAPL")
+    df : pd.DataFrame
+        data to be plotted
+
+    Returns
+    -------
+    str
+        filename of the plot (ex. "eps-AAPL-0123456789abcdef.png")
     """
-    df = pd.read_sql_query(statement, conn)
-    # format as Datetime
-    df.Date = pd.to_datetime(df.Date)
-    return df
+    hashes = pd.util.hash_pandas_object(df).to_numpy()
+    digest = hashlib.sha256(hashes.tobytes()).hexdigest()
+    return f"{prefix}-{digest[:16]}.png"
 
 
-def insert_rate(conn, currency, date, rate):
-    '''Insert a record of exchange rate to the database
+# Exchange Rates --------------------------------------------------------------
+def insert_rates_many(conn, rows):
+    '''Insert records of exchange rates to the database in one batch
 
     Parameters
     ----------
     conn
         connection to database
-    currency: str
-        currency of choice
-    date: str
-        date of choice
-    rate: str
-        exchange rate of that currency on that day
+    rows: list
+        list of (currency, date, rate) tuples
 
     Returns
     -------
     None
     '''
     cur = conn.cursor()
-    statement = f"""
-        INSERT INTO "Rates{currency}"
-        VALUES ('{date}', {rate})
+    statement = """
+        INSERT OR IGNORE INTO "Rates"
+        VALUES (?, ?, ?)
     """
-    cur.execute(statement)
-    conn.commit()
+    cur.executemany(statement, rows)
 
 
-def get_rates_for(currency: str, date: str):
+def get_rates_for(currencies: list, date: str):
     """Make a API call to get the daily exchange rates against USD
 
     Parameters
     ----------
-    currency : str
-        currency to be acquired
+    currencies : list
+        currencies to be acquired, all returned by a single call
     date : str
         date to be acquired
 
@@ -245,12 +469,60 @@ def get_rates_for(currency: str, date: str):
         returned json from the api call
     """
     baseurl = f"https://openexchangerates.org/api/historical/{date}.json"
-    params = {"app_id": OEG_APP_ID, "symbols": currency, "base": "USD"}
+    params = {
+        "app_id": OEG_APP_ID,
+        "symbols": ",".join(currencies),
+        "base": "USD"
+    }
     return make_request(baseurl=baseurl, params=params)
 
 
-def get_rates_with_cache(conn, currency: str, date: str):
-    """Get the daily exchange rates against USD with caching to database
+def prefetch_rates(conn, currencies: list, dates: list, max_workers: int = 16):
+    """Get the daily exchange rates for many currencies/dates at once
+       making one API call per date not fully cached yet, concurrently
+
+    Parameters
+    ----------
+    conn
+        connection to database
+    currencies : list
+        currencies to be acquired
+    dates : list
+        dates to be acquired
+    max_workers : int
+        maximum number of API calls in flight at once
+
+    Returns
+    -------
+    None
+    """
+    cur = conn.cursor()
+    statement = f"""
+        SELECT Currency, Date
+        FROM Rates
+        WHERE Currency IN ({", ".join("?" * len(currencies))});
+    """
+    cached = set(cur.execute(statement, currencies).fetchall())
+    # currencies still missing on each date
+    missing = {}
+    for date in sorted(set(dates)):
+        lacking = [c for c in currencies if (c, date) not in cached]
+        if lacking:
+            missing[date] = lacking
+    # the API calls are independent, so make them concurrently
+    responses = fetch_many(lambda date: get_rates_for(missing[date], date),
+                           list(missing), max_workers=max_workers)
+    rows = [(currency, date, response["rates"][currency])
+            for date, response in zip(missing, responses)
+            for currency in missing[date]]
+    # update database in one transaction
+    with conn:
+        insert_rates_many(conn, rows)
+
+
+def get_rates_map(conn, currency: str, dates: list, max_workers: int = 16):
+    """Get the daily exchange rates of the currency for many dates
+       as a {date: rate} dictionary (each date is looked up only once)
 
     Parameters
     ----------
@@ -258,23 +530,36 @@ def get_rates_with_cache(conn, currency: str, date: str):
         connection to database
     currency : str
         currency to be acquired
-    date : str
-        date to be acquired
+    dates : list
+        dates to be acquired (may contain duplicates)
+    max_workers : int
+        maximum number of API calls in flight at once
 
     Returns
     -------
-    float
-        exchange rate on that day
+    dict
+        exchange rates keyed by date
     """
-    df = load_table_currency(conn, currency)
-    # if not cached
-    if not df.Date.isin([date]).any():
-        response = get_rates_for(currency=currency, date=date)
-        # update database
-        insert_rate(conn, currency, date, response["rates"][currency])
-        # reload database
-        df = load_table_currency(conn, currency)
-    return df.query(f'Date == "{date}"')["Rates"].iloc[-1]
+    dates = sorted(set(dates))
+    # look up all the cached dates in one query
+    cur = conn.cursor()
+    statement = f"""
+        SELECT Date, Rate
+        FROM Rates
+        WHERE Currency = ? AND Date IN ({", ".join("?" * len(dates))});
+    """
+    rates = dict(cur.execute(statement, [currency, *dates]).fetchall())
+    # get the rest using API calls, concurrently
+    misses = [date for date in dates if date not in rates]
+    responses = fetch_many(lambda date: get_rates_for([currency], date),
+                           misses, max_workers=max_workers)
+    rows = [(currency, date, response["rates"][currency])
+            for date, response in zip(misses, responses)]
+    # update database in one transaction
+    with conn:
+        insert_rates_many(conn, rows)
+    rates.update({date: rate for _, date, rate in rows})
+    return rates
 
 
 # Sample Cases ------------------------
@@ -284,80 +569,70 @@ def get_rates_with_cache(conn, currency: str, date: str):
 #     for d in ["01", "05", "10", "15", "20", "25"]:
 #         sample_dates.append(f"2020-{m}-{d}")
 
-# for currency in sample_currencies:
-#     for date in sample_dates:
-#         get_rates_with_cache(conn, currency, date)
+# prefetch_rates(conn, sample_currencies, sample_dates)
 
 
 # Stock Info ------------------------------------------------------------------
 
 # ETFs --------------------------------
-def gen_table_for_ETF(conn):
-    '''Generate a table for ETFs in the database if not exist
+def insert_etfs_many(conn, rows):
+    '''Insert records of etfs to the database in one batch
 
     Parameters
     ----------
     conn
         connection to database
+    rows: list
+        list of (symbol, name, exchange, lastupdate) tuples
 
     Returns
     -------
     None
     '''
     cur = conn.cursor()
-    statement = f"""
-        CREATE TABLE IF NOT EXISTS "ETFs"(
-            "Symbol" TEXT PRIMARY KEY UNIQUE,
-            "Name" TEXT,
-            "Exchange" TEXT,
-            "LastUpdate" NUMERIC
-        );
+    statement = """
+        INSERT OR IGNORE INTO "ETFs"
+        VALUES (?, ?, ?, ?)
     """
-    cur.execute(statement)
-
+    cur.executemany(statement, rows)
 
-def insert_etf(conn, symbol, name, exchange):
-    '''Insert a record of etf to the database
 
-    Parameters
-    ----------
-    conn
-        connection to database
-    symbol: str
-        ticker symbol of the ETF
-    name: str
-        full name of the ETF
-    exchange: str
-        exchange in which the ETF is traded
+def get_ETFs_for():
+    """Get all ETFs available in the market through API
 
     Returns
     -------
-    None
-    '''
-    cur = conn.cursor()
-    statement = f"""
-        INSERT INTO "ETFs"
-        VALUES (?, ?, ?, ?)
+    list
+        list of (symbol, name, exchange, lastupdate) tuples
     """
-    today = datetime.date.today()
-    row = [symbol, name, exchange, today.strftime("%Y-%m-%d")]
-    cur.execute(statement, row)
-    conn.commit()
+    baseurl = "https://financialmodelingprep.com/api/v3/etf/list"
+    params = {"apikey": FMP_API_KEY}
+    # reuse the list for half a day
+    etfs = make_request(baseurl=baseurl, params=params, ttl=12 * 60 * 60)
+    today = datetime.date.today().toordinal()
+    return [(etf["symbol"], etf["name"], etf["exchange"], today)
+            for etf in etfs]
 
 
-def fill_table_for_ETF(conn):
+def fill_table_for_ETF(conn, replace=False):
     """Insert all ETFs available in the market into the database
 
     Parameters
     ----------
     conn
         connection to the database
+    replace : bool
+        whether to delete the old records first
     """
-    baseurl = f"https://financialmodelingprep.com/api/v3/etf/list"
-    params = {"apikey": FMP_API_KEY}
-    etfs = make_request(baseurl=baseurl, params=params)
-    for etf in etfs:
-        insert_etf(conn, etf["symbol"], etf["name"], etf["exchange"])
+    # call API before the transaction, so that the database is not
+    # locked while waiting for the response
+    # (old records are kept if the API call fails)
+    rows = get_ETFs_for()
+    # update database in one transaction
+    with conn:
+        if replace:
+            delete_table_for_ETF(conn)
+        insert_etfs_many(conn, rows)
 
 
 def delete_table_for_ETF(conn):
@@ -369,11 +644,14 @@ def delete_table_for_ETF(conn):
         connection to the database
     """
     cur = conn.cursor()
-    statement = f"""
+    statement = """
         DELETE FROM ETFs
     """
     cur.execute(statement)
-    conn.commit()
+
+
+# ETF list kept in this process, re-checked against the database once a day
+ETF_MEMO = {}
 
 
 def get_all_ETFs_with_cache(conn):
@@ -389,58 +667,58 @@ def get_all_ETFs_with_cache(conn):
     pd.DataFrame
         dataframe containing all the ETFs
     """
-    # if there is no such table, generate new one
-    if not check_table_exist(conn, tablename="ETFs"):
-        gen_table_for_ETF(conn)
-    df = load_table_as_pd(conn, tablename="ETFs")
+    today = datetime.date.today()
+    # if already checked today in this process
+    if ETF_MEMO.get("Checked") == today:
+        return ETF_MEMO["ETFs"]
+    cur = conn.cursor()
+    # days since the last update
+    statement = """
+        SELECT ? - LastUpdate
+        FROM ETFs
+        LIMIT 1;
+    """
+    record = cur.execute(statement, [today.toordinal()]).fetchone()
     # if the table is empty
-    if len(df) == 0:
+    if record is None:
         fill_table_for_ETF(conn)
-    else:
-        # check when it's updated
-        today = datetime.date.today()
-        latest = datetime.datetime.strptime(df.LastUpdate.iloc[0],
-                                            '%Y-%m-%d').date()
-        delta = today - latest
-        # if too old (more than 30 days)
-        if delta.days >= 30:
-            # delete old records
-            delete_table_for_ETF(conn)
-            # fill in new records
-            fill_table_for_ETF(conn)
+    # if too old (more than 30 days)
+    elif record[0] >= 30:
+        # replace old records
+        fill_table_for_ETF(conn, replace=True)
     # reload latest list
     df = load_table_as_pd(conn, tablename="ETFs")
+    records = {etf["Symbol"]: etf for etf in df.to_dict('records')}
+    ETF_MEMO["ETFs"] = df
+    ETF_MEMO["Records"] = records
+    # mark as checked last, so that other threads never see a partial memo
+    ETF_MEMO["Checked"] = today
     return df
 
-# Sample Code ------------------------------
-# etfs = get_all_ETFs_with_cache(conn)
-# etfs
 
-
-# Companies --------------------------------
-def gen_table_for_company(conn):
-    '''Generate a table for companies in the database if not exist
+def get_ETF_records_with_cache(conn):
+    """Get the records of all the ETFs keyed by ticker symbol
+       (for O(1) membership checks and lookups)
 
     Parameters
     ----------
     conn
-        connection to database
+        connection to the database
 
     Returns
     -------
-    None
-    '''
-    cur = conn.cursor()
-    statement = f'''
-        CREATE TABLE IF NOT EXISTS "Companies" (
-            "Symbol" TEXT PRIMARY KEY UNIQUE,
-            "Name" TEXT,
-            "Exchange" TEXT
-        );
-    '''
-    cur.execute(statement)
+    dict
+        record of each ETF (as a dict), keyed by its ticker symbol
+    """
+    get_all_ETFs_with_cache(conn)
+    return ETF_MEMO["Records"]
+
+# Sample Code ------------------------------
+# etfs = get_all_ETFs_with_cache(conn)
+# etfs
 
 
+# Companies --------------------------------
 def insert_company(conn, symbol, name, exchange):
     '''Insert a record of a company to the database
 
@@ -460,14 +738,12 @@ def insert_company(conn, symbol, name, exchange):
     None
     '''
     cur = conn.cursor()
-    statement = f"""
-        INSERT INTO "Companies"
+    statement = """
+        INSERT OR IGNORE INTO "Companies"
         VALUES (?, ?, ?)
     """
-    today = datetime.date.today()
     row = [symbol, name, exchange]
     cur.execute(statement, row)
-    conn.commit()
 
 
 def get_company_info_for(symbol: str):
@@ -485,7 +761,9 @@ def get_company_info_for(symbol: str):
     """
     baseurl = "https://financialmodelingprep.com/api/v3/search"
     params = {"query": symbol, "apikey": FMP_API_KEY, "limit": "1"}
-    return make_request(baseurl=baseurl, params=params)
+    # company info rarely changes, reuse it for 30 days
+    return make_request(baseurl=baseurl, params=params,
+                        ttl=30 * 24 * 60 * 60)
 
 
 # def get_market_cap_for(symbol: str):
@@ -509,10 +787,15 @@ def fill_record_for_company(conn, symbol):
     # call APIs
     info = get_company_info_for(symbol)
     # insert new record into db
-    insert_company(conn=conn,
-                   symbol=symbol,
-                   name=info[0]["name"],
-                   exchange=info[0]["exchangeShortName"])
+    with conn:
+        insert_company(conn=conn,
+                       symbol=symbol,
+                       name=info[0]["name"],
+                       exchange=info[0]["exchangeShortName"])
+
+
+# company info already looked up in this process (it never changes)
+COMPANY_MEMO = {}
 
 
 def get_company_info_with_cache(conn, symbol: str):
@@ -530,61 +813,26 @@ def get_company_info_with_cache(conn, symbol: str):
     pd.DataFrame
         pandas DataFrame containing info of the company
     """
-    # if there is no such table, generate new one
-    if not check_table_exist(conn, tablename="Companies"):
-        gen_table_for_company(conn)
-    df = load_table_as_pd(conn, tablename="Companies")
+    # if already looked up in this process
+    if symbol in COMPANY_MEMO:
+        return COMPANY_MEMO[symbol].copy()
+    df = load_record_as_pd(conn, tablename="Companies", symbol=symbol)
     # if not cached
-    if not df.Symbol.isin([symbol]).any():
+    if len(df) == 0:
         fill_record_for_company(conn, symbol)
-        # reload df
-        df = load_table_as_pd(conn, tablename="Companies")
-    return df.query(f"Symbol == '{symbol}'")
+        df = load_record_as_pd(conn, tablename="Companies", symbol=symbol)
+    COMPANY_MEMO[symbol] = df
+    return df.copy()
 
 
 # EPS ---------------------------------
-def gen_table_for_eps(conn):
-    '''Generate a table for EPSs in the database if not exist
-
-    Parameters
-    ----------
-    conn
-        connection to database
-
-    Returns
-    -------
-    None
-    '''
-    cur = conn.cursor()
-    statement = f'''
-        CREATE TABLE IF NOT EXISTS "EPS" (
-            "Symbol" TEXT PRIMARY KEY UNIQUE,
-            "EPS1Date" NUMERIC,
-            "EPS1Reported" REAL,
-            "EPS1Expected" REAL,
-            "EPS2Date" NUMERIC,
-            "EPS2Reported" REAL,
-            "EPS2Expected" REAL,
-            "EPS3Date" NUMERIC,
-            "EPS3Reported" REAL,
-            "EPS3Expected" REAL,
-            "EPS4Date" NUMERIC,
-            "EPS4Reported" REAL,
-            "EPS4Expected" REAL,
-            "LastUpdate" NUMERIC,
-            FOREIGN KEY(Symbol)
-                REFERENCES Companies(Symbol)
-        );
-    '''
-    cur.execute(statement)
-
-
 def insert_eps(conn, symbol,
                eps1date, eps1reported, eps1expected,
                eps2date, eps2reported, eps2expected,
                eps3date, eps3reported, eps3expected,
                eps4date, eps4reported, eps4expected):
-    '''Insert a record of EPS in the latest 4 quarters for the company
+    '''Insert (or update, if it exists) a record of EPS
+       in the latest 4 quarters for the company
 
     Parameters
     ----------
@@ -603,21 +851,54 @@ def insert_eps(conn, symbol,
     -------
     None
     '''
-    cur = conn.cursor()
-    statement = f"""
-        INSERT INTO "EPS"
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """
-    today = datetime.date.today()
+    # store dates as ordinal days so that staleness is a subtraction
+    today = datetime.date.today().toordinal()
     row = [
         symbol, eps1date, eps1reported, eps1expected,
         eps2date, eps2reported, eps2expected,
         eps3date, eps3reported, eps3expected,
         eps4date, eps4reported, eps4expected,
-        today.strftime("%Y-%m-%d")
+        today
     ]
-    cur.execute(statement, row)
-    conn.commit()
+    insert_eps_many(conn, [row])
+
+
+def insert_eps_many(conn, rows):
+    '''Insert (or update, if they exist) records of EPS in one batch
+
+    Parameters
+    ----------
+    conn
+        connection to database
+    rows: list
+        list of (symbol, eps1date, eps1reported, eps1expected, ...,
+        eps4expected, lastupdate) tuples
+
+    Returns
+    -------
+    None
+    '''
+    cur = conn.cursor()
+    statement = """
+        INSERT INTO "EPS"
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(Symbol) DO UPDATE SET
+            EPS1Date = excluded.EPS1Date,
+            EPS1Reported = excluded.EPS1Reported,
+            EPS1Expected = excluded.EPS1Expected,
+            EPS2Date = excluded.EPS2Date,
+            EPS2Reported = excluded.EPS2Reported,
+            EPS2Expected = excluded.EPS2Expected,
+            EPS3Date = excluded.EPS3Date,
+            EPS3Reported = excluded.EPS3Reported,
+            EPS3Expected = excluded.EPS3Expected,
+            EPS4Date = excluded.EPS4Date,
+            EPS4Reported = excluded.EPS4Reported,
+            EPS4Expected = excluded.EPS4Expected,
+            LastUpdate = excluded.LastUpdate
+        WHERE excluded.LastUpdate > EPS.LastUpdate
+    """
+    cur.executemany(statement, rows)
 
 
 def get_eps_for(symbol: str):
@@ -633,13 +914,14 @@ def get_eps_for(symbol: str):
     dict
         returned json from the API call
     """
-    baseurl = "https://www.alphavantage.co/query"
+    baseurl = ALPHA_URL
     params = {
         "function": "EARNINGS",
         "symbol": symbol,
         "apikey": ALPHA_API_KEY
     }
-    return make_request(baseurl=baseurl, params=params)
+    # reuse the EPSs for half a day
+    return make_request(baseurl=baseurl, params=params, ttl=12 * 60 * 60)
 
 
 def fill_record_for_eps(conn, symbol):
@@ -656,27 +938,29 @@ def fill_record_for_eps(conn, symbol):
     try:
         # call APIs
         eps = get_eps_for(symbol)
+        quarters = eps["quarterlyEarnings"]
         # insert new record into db
-        insert_eps(conn=conn,
-                   symbol=symbol,
-                   eps1date=eps["quarterlyEarnings"][0]["fiscalDateEnding"],
-                   eps1reported=eps["quarterlyEarnings"][0]["reportedEPS"],
-                   eps1expected=eps["quarterlyEarnings"][0]["estimatedEPS"],
-                   eps2date=eps["quarterlyEarnings"][1]["fiscalDateEnding"],
-                   eps2reported=eps["quarterlyEarnings"][1]["reportedEPS"],
-                   eps2expected=eps["quarterlyEarnings"][1]["estimatedEPS"],
-                   eps3date=eps["quarterlyEarnings"][2]["fiscalDateEnding"],
-                   eps3reported=eps["quarterlyEarnings"][2]["reportedEPS"],
-                   eps3expected=eps["quarterlyEarnings"][2]["estimatedEPS"],
-                   eps4date=eps["quarterlyEarnings"][3]["fiscalDateEnding"],
-                   eps4reported=eps["quarterlyEarnings"][3]["reportedEPS"],
-                   eps4expected=eps["quarterlyEarnings"][3]["estimatedEPS"])
+        with conn:
+            insert_eps(conn=conn,
+                       symbol=symbol,
+                       eps1date=quarters[0]["fiscalDateEnding"],
+                       eps1reported=quarters[0]["reportedEPS"],
+                       eps1expected=quarters[0]["estimatedEPS"],
+                       eps2date=quarters[1]["fiscalDateEnding"],
+                       eps2reported=quarters[1]["reportedEPS"],
+                       eps2expected=quarters[1]["estimatedEPS"],
+                       eps3date=quarters[2]["fiscalDateEnding"],
+                       eps3reported=quarters[2]["reportedEPS"],
+                       eps3expected=quarters[2]["estimatedEPS"],
+                       eps4date=quarters[3]["fiscalDateEnding"],
+                       eps4reported=quarters[3]["reportedEPS"],
+                       eps4expected=quarters[3]["estimatedEPS"])
     except KeyError:
         print(f"EPS({symbol}): API call limit reached. Try again later.")
 
 
-def delete_record_for_eps(conn, symbol):
-    """Delete a record of the company from EPS table in the database
+def get_eps_with_cache(conn, symbol: str):
+    """Get EPSs of the company using API & caches in the database
 
     Parameters
     ----------
@@ -684,56 +968,82 @@ def delete_record_for_eps(conn, symbol):
         connection to the database
     symbol : str
         ticker symbol of the company
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame containing EPSs of the company
     """
     cur = conn.cursor()
-    statement = f"""
-        DELETE FROM EPS
-        WHERE Symbol='{symbol}'
+    # days since the last update
+    statement = """
+        SELECT ? - LastUpdate
+        FROM EPS
+        WHERE Symbol = ?;
     """
-    cur.execute(statement)
-    conn.commit()
+    today = datetime.date.today().toordinal()
+    record = cur.execute(statement, [today, symbol]).fetchone()
+    # if not cached, or too old (more than 10 days)
+    if record is None or record[0] >= 10:
+        # insert the record, or update it in place
+        # (old record is kept if the API call fails)
+        fill_record_for_eps(conn, symbol)
+    # reload db
+    return load_record_as_pd(conn, tablename="EPS", symbol=symbol)
 
 
-def get_eps_with_cache(conn, symbol: str):
-    """Get EPSs of the company using API & caches in the database
+def refresh_stale_eps(conn, cutoff_days: int = 10, max_workers: int = 5):
+    """Update all the EPS records older than cutoff_days at once
+       making the API calls concurrently
 
     Parameters
     ----------
     conn
         connection to the database
-    symbol : str
-        ticker symbol of the company
+    cutoff_days : int
+        records updated this many days ago (or earlier) are refreshed
+    max_workers : int
+        maximum number of API calls in flight at once
 
     Returns
     -------
-    pd.DataFrame
-        DataFrame containing EPSs of the company
+    None
     """
-    # if there is no such table, generate new one
-    if not check_table_exist(conn, tablename="EPS"):
-        gen_table_for_eps(conn)
-    df = load_table_as_pd(conn, tablename="EPS")
-    # if not cached
-    if not df.Symbol.isin([symbol]).any():
-        fill_record_for_eps(conn, symbol)
-    else:
-        # check when it's updated
-        today = datetime.date.today()
-        update = df.query(f"Symbol == '{symbol}'").LastUpdate.iloc[0]
-        update = datetime.datetime.strptime(update, '%Y-%m-%d').date()
-        delta = today - update
-        # if too old (more than 10 days)
-        if delta.days >= 10:
-            # delete old record
-            delete_record_for_eps(conn, symbol)
-            # fill new record
-            fill_record_for_eps(conn, symbol)
-    # reload db
-    df = load_table_as_pd(conn, tablename="EPS")
-    return df.query(f"Symbol == '{symbol}'")
+    cur = conn.cursor()
+    # one range scan on the LastUpdate index
+    statement = """
+        SELECT Symbol
+        FROM EPS
+        WHERE LastUpdate <= ?;
+    """
+    today = datetime.date.today().toordinal()
+    symbols = [row[0] for row in cur.execute(statement, [today - cutoff_days])]
+
+    # (the calls wait for the API call limit themselves)
+    responses = fetch_many(get_eps_for, symbols, max_workers=max_workers)
+    rows = []
+    for symbol, eps in zip(symbols, responses):
+        try:
+            quarters = eps["quarterlyEarnings"][:4]
+            # every row needs four quarters
+            if len(quarters) < 4:
+                print(f"EPS({symbol}): fewer than 4 quarters reported.")
+                continue
+            rows.append((symbol,
+                         *[quarter[field] for quarter in quarters
+                           for field in ("fiscalDateEnding", "reportedEPS",
+                                         "estimatedEPS")],
+                         today))
+        except KeyError:
+            print(f"EPS({symbol}): API call limit reached. Try again later.")
+    # update database in one transaction, from this thread only
+    with conn:
+        insert_eps_many(conn, rows)
 
 
 # Sample Cases ------------------------
+# refresh_stale_eps(conn)
+
 # sample_companies = ["AAPL", "BNTX", "DAL", "MAR", "NVAX", "MRNA"]
 # for company in sample_companies:
 #     company_record = get_company_info_with_cache(conn, company)
@@ -747,134 +1057,166 @@ def get_eps_with_cache(conn, symbol: str):
 
 
 # Time Series -----------------------------------------------------------------
-def gen_table_for_history(conn, year: str):
-    '''Generate a table of timeseries for a year in the database if not exist
-
-    Parameters
-    ----------
-    conn
-        connection to database
-    year: str
-        year of choice
-
-    Returns
-    -------
-    None
-    '''
-    cur = conn.cursor()
-    statement = f'''
-        CREATE TABLE IF NOT EXISTS "History{year}" (
-            "Date" NUMERIC,
-            "Symbol" TEXT,
-            "Open" REAL,
-            "High" REAL,
-            "Low" REAL,
-            "Close" REAL,
-            "Volume" REAL,
-            "AdjustedClose" REAL,
-            "Ratio" REAL
-        );
-    '''
-    cur.execute(statement)
-
-
-def get_history_for(symbol: str):
-    """Make an API call to get time series of the company
+def get_history_for(symbol: str, year: str):
+    """Make an API call to get time series of the company in the year
+       (the response is streamed, so only the days of the year are parsed)
 
     Parameters
     ----------
     symbol : str
         ticker symbol of the company
+    year : str
+        year of choice
 
     Returns
     -------
     dict
-        returned json
+        daily prices of the year, {date: {field: value}}
+        (empty when API call limit reached)
     """
-    baseurl = "https://www.alphavantage.co/query"
+    baseurl = ALPHA_URL
     params = {
         "function": "TIME_SERIES_DAILY_ADJUSTED",  # account for split/dividend
         "symbol": symbol,
         "outputsize": "full",  # if "full", get 20 years of data
         "apikey": ALPHA_API_KEY
     }
-    return make_request(baseurl=baseurl, params=params)
-
-
-def insert_history(conn, symbol, date, open, high, low, close, volume,
-                   adjusted):
-    '''Insert a record of daily price data of the selected company/date
+    series = {}
+    # respect the API call limit (5 per minute)
+    wait_for_alpha_vantage()
+    with SESSION.get(baseurl, params=params, timeout=10,
+                     stream=True) as response:
+        response.raw.decode_content = True  # let gzip be decompressed
+        days = ijson.kvitems(response.raw, "Time Series (Daily)")
+        for date, prices in days:
+            if date.startswith(year):
+                series[date] = prices
+            # days come newest first, so stop once we pass the year
+            elif date < year:
+                break
+    return series
+
+
+def insert_history_many(conn, rows):
+    '''Insert records of daily price data in one batch
 
     Parameters
     ----------
     conn
         connection to database
-    symbol: str
-        ticker symbol of the company/ETF
-    date: str
-        date of this record
-    open: str
-        open price of the stock on that day
-    high: str
-        highest price of the stock on that day
-    low: str
-        lowest price of the stock on that day
-    close: str
-        closing price of the stock on that day
-    volume: str
-        trading volume of the stock on that day
-    adjusted: str
-        adjusted closing price accounting for split/devidend
-
+    rows: list
+        list of (date, symbol, open, high, low, close, volume,
+        adjusted, ratio) tuples
 
     Returns
     -------
     None
     '''
-    # if there is no such table, generate new one
-    if not check_table_exist(conn, f"History{date[:4]}"):
-        gen_table_for_history(conn, date[:4])
     cur = conn.cursor()
-    statement = f"""
-        INSERT INTO "History{date[:4]}"
+    statement = """
+        INSERT OR IGNORE INTO "History"
         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
     """
-    ratio = float(adjusted)/float(close)
-    row = [date, symbol, open, high, low, close, volume, adjusted, ratio]
-    cur.execute(statement, row)
-    conn.commit()
+    cur.executemany(statement, rows)
+
+
+def is_history_cached(conn, symbol: str, year: str):
+    """Check if timeseries of the selected company/year is in the database
+
+    Parameters
+    ----------
+    conn
+        connection to database
+    symbol : str
+        ticker symbol of the company
+    year : str
+        year of choice
+
+    Returns
+    -------
+    bool
+        whether any record of the symbol/year exists
+    """
+    cur = conn.cursor()
+    # probe a single row (the prices are loaded once, for the plot)
+    statement = """
+        SELECT 1
+        FROM History
+        WHERE Symbol = ? AND Date BETWEEN ? AND ?
+        LIMIT 1;
+    """
+    params = [symbol, f"{year}-01-01", f"{year}-12-31"]
+    return cur.execute(statement, params).fetchone() is not None
 
 
-def load_table_history(conn, year: str):
-    """Load a table of timeseries of the year in the database
-       as a pandas DataFrame
+def load_history_for_plot(conn, symbol: str, year: str):
+    """Load adjusted OHLC prices of the selected company/year
+       in the database, ready for mplfinance
 
     Parameters
     ----------
     conn
         connection to database
+    symbol : str
+        ticker symbol of the company
     year : str
         year of choice
 
     Returns
     -------
     pd.DataFrame
-        dataframe converted from a table
+        dataframe indexed by Date (DatetimeIndex), sorted by Date
     """
-    # if there is no such table, generate new one
-    if not check_table_exist(conn, f"History{year}"):
-        gen_table_for_history(conn, year)
-    # get table as a pandas dataframe
-    statement = f"""
-        SELECT *
-        FROM 'History{year}';
+    # adjust values accounting for split/dividend inside the query
+    statement = """
+        SELECT Date, Open * Ratio AS Open, High * Ratio AS High,
+               Low * Ratio AS Low, AdjustedClose AS Close, Volume
+        FROM History
+        WHERE Symbol = ? AND Date BETWEEN ? AND ?
+        ORDER BY Date;
     """
-    df = pd.read_sql_query(statement, conn)
-    # format as Datetime
-    df.Date = pd.to_datetime(df.Date)
+    params = [symbol, f"{year}-01-01", f"{year}-12-31"]
+    df = pd.read_sql_query(statement, conn, params=params,
+                           parse_dates={"Date": {"format": "%Y-%m-%d"}},
+                           index_col="Date")
     return df
 
 
+# fields of the API response in the column order of the History table
+HISTORY_FIELDS = ["1. open", "2. high", "3. low", "4. close", "6. volume",
+                  "5. adjusted close"]
+
+
+def parse_history(series: dict, symbol: str):
+    """Convert daily prices returned by get_history_for into History records
+
+    Parameters
+    ----------
+    series : dict
+        daily prices, {date: {field: value}}
+    symbol : str
+        ticker symbol of the company
+
+    Returns
+    -------
+    list
+        (Date, Symbol, Open, High, Low, Close, Volume, AdjustedClose, Ratio)
+        rows; raises KeyError when API call limit reached
+    """
+    # no days returned when API call limit reached
+    if not series:
+        raise KeyError("Time Series (Daily)")
+    dates = list(series)
+    # parse prices of all the days at once as a float array
+    prices = np.array([[series[k][field] for field in HISTORY_FIELDS]
+                       for k in dates], dtype=float)
+    prices = prices.reshape(-1, len(HISTORY_FIELDS))
+    # ratio = adjusted close / close
+    ratio = prices[:, 5] / prices[:, 3]
+    values = np.column_stack([prices, ratio]).tolist()
+    return [(date, symbol, *v) for date, v in zip(dates, values)]
+
+
 def get_history_with_cache(conn, symbol: str, year: str):
     """Get time series of the selected company/year
        using API call and cache in the database
@@ -890,52 +1232,89 @@ def get_history_with_cache(conn, symbol: str, year: str):
 
     Returns
     -------
-    pd.DataFrame
-        DataFrame containing time series data
+    bool
+        whether time series data is available in the database
     """
-    if not check_table_exist(conn, f"History{year}"):
-        gen_table_for_history(conn, year)
-    # load db as pandas Dataframe
-    df = load_table_history(conn, year)
     # if not cached
-    if not df.Symbol.isin([symbol]).any():
+    if not is_history_cached(conn, symbol, year):
         try:
-            response = get_history_for(symbol=symbol)
-            for k, v in response["Time Series (Daily)"].items():
-                if k.startswith(year):
-                    insert_history(conn,
-                                   symbol=symbol,
-                                   date=k,
-                                   open=v["1. open"],
-                                   high=v["2. high"],
-                                   low=v["3. low"],
-                                   close=v["4. close"],
-                                   volume=v["6. volume"],
-                                   adjusted=v["5. adjusted close"])
+            series = get_history_for(symbol=symbol, year=year)
+            rows = parse_history(series, symbol)
+            # update database in one transaction
+            with conn:
+                insert_history_many(conn, rows)
         # when API call limit (5 per minute) reached
         except KeyError:
             print(
                 f"History({symbol}, {year}): API call limit reached.",
                 "Try again later."
             )
-        # reload database
-        df = load_table_history(conn, year)
-    # return price history for the given symbol & year
-    return df.query(f"Symbol == '{symbol}'")
+        # check database again
+        return is_history_cached(conn, symbol, year)
+    return True
+
+
+def prefetch_history(conn, symbols: list, year: str, max_workers: int = 5):
+    """Get time series of many companies for the selected year at once
+       making the API calls not cached yet concurrently
+
+    Parameters
+    ----------
+    conn
+        connection to the database
+    symbols : list
+        ticker symbols of the companies
+    year : str
+        year of choice
+    max_workers : int
+        maximum number of API calls in flight at once
+
+    Returns
+    -------
+    None
+    """
+    cur = conn.cursor()
+    statement = f"""
+        SELECT DISTINCT Symbol
+        FROM History
+        WHERE Symbol IN ({", ".join("?" * len(symbols))})
+        AND Date BETWEEN ? AND ?;
+    """
+    params = [*symbols, f"{year}-01-01", f"{year}-12-31"]
+    cached = {row[0] for row in cur.execute(statement, params)}
+    missing = [s for s in dict.fromkeys(symbols) if s not in cached]
+
+    def fetch(symbol):
+        # (waits for the API call limit itself)
+        return get_history_for(symbol=symbol, year=year)
+
+    responses = fetch_many(fetch, missing, max_workers=max_workers)
+    rows = []
+    for symbol, series in zip(missing, responses):
+        try:
+            rows += parse_history(series, symbol)
+        except KeyError:
+            print(
+                f"History({symbol}, {year}): API call limit reached.",
+                "Try again later."
+            )
+    # update database in one transaction, from this thread only
+    with conn:
+        insert_history_many(conn, rows)
 
 
 # Sample Cases ------------------------
 # sample_symbols = ["AAPL", "BNTX"]
 # sample_years = ["2020"]
 
-# for symbol in sample_symbols:
-#     for year in sample_years:
-#         df = get_history_with_cache(conn, symbol, year)
+# for year in sample_years:
+#     prefetch_history(conn, sample_symbols, year)
 
 
 # Draw TimeSeries Graphs ------------------------------------------------------
-def gen_plot_history(conn, symbol: str, year: str, timestamp: str):
+def gen_plot_history(conn, symbol: str, year: str):
     """Draw&save time series plot of the selected company/year
+       (an existing plot of the same data is reused)
 
     Parameters
     ----------
@@ -945,35 +1324,32 @@ def gen_plot_history(conn, symbol: str, year: str, timestamp: str):
         ticker symbol of the company
     year : str
         year of choice
-    timestamp : str
-        timestamp indicating when this function called,
-        used for filenames in order to prevent browser cache
+
+    Returns
+    -------
+    str
+        filename of the plot in '/images'
     """
-    df = get_history_with_cache(conn, symbol, year)
-    # remove existing plot
-    if glob.glob('images/history*.png'):
-        for f in glob.glob("images/history*.png"):
-            os.remove(f)
-    # when API call limit reached
-    if len(df) == 0:
-        # show error message as an image
-        shutil.copy("error_hist_not_shown.png",
-                    f"images/history{timestamp}.png")
-    # when data available
-    else:
-        # adjust values accounting for split/dividend
-        df["Close"] = df["AdjustedClose"]
-        df["Open"] = df["Open"] * df["Ratio"]
-        df["High"] = df["High"] * df["Ratio"]
-        df["Low"] = df["Low"] * df["Ratio"]
-        # generate new plot
-        df.set_index("Date", inplace=True)
-        mpf.plot(df.sort_values(by=["Date"]),
-                 type="candle",
-                 style="charles",
-                 title=f"{symbol}, {year}, Adjusted Daily OHLC Prices",
-                 volume=True,
-                 savefig=f"images/history{timestamp}.png")
+    # when API call limit reached, show error message as an image
+    if not get_history_with_cache(conn, symbol, year):
+        return "error_hist_not_shown.png"
+    # the only full read of the prices
+    prices = load_history_for_plot(conn, symbol, year)
+    filename = gen_plot_filename(f"history-{symbol}-{year}", prices)
+    # when data changed (or never plotted)
+    if not os.path.exists(f"images/{filename}"):
+        # generate new plot from the adjusted prices
+        # (mplfinance draws through pyplot, so one plot at a time)
+        load_plotting()
+        with PLOT_LOCK:
+            mpf.plot(prices,
+                     type="candle",
+                     style="charles",
+                     title=f"{symbol}, {year}, Adjusted Daily OHLC Prices",
+                     volume=True,
+                     savefig=f"images/{filename}")
+    register_plot(filename)
+    return filename
 
 
 # Sample Cases ------------------------
@@ -1005,16 +1381,46 @@ def get_news(symbol):
               "page": "1",
               "apiKey": POLYGON_API_KEY}
     response = make_request(baseurl=baseurl, params=params)
-    today = datetime.date.today()
-    response = {"Fetched": today.strftime("%Y-%m-%d"), "News": response}
+    today = datetime.date.today().toordinal()
+    response = {"Fetched": today, "News": response}
     return response
 
 
-def get_news_with_cache(symbol):
+def insert_news(conn, symbol, fetched, news):
+    '''Insert (or replace) a record of the latest news of the company
+
+    Parameters
+    ----------
+    conn
+        connection to database
+    symbol: str
+        ticker symbol of the company
+    fetched: int
+        date when the news is fetched (ordinal day)
+    news: list
+        list of articles returned from the API call
+
+    Returns
+    -------
+    None
+    '''
+    cur = conn.cursor()
+    statement = """
+        INSERT OR REPLACE INTO "News"
+        VALUES (?, ?, ?)
+    """
+    row = [symbol, fetched, orjson.dumps(news).decode()]
+    cur.execute(statement, row)
+
+
+def get_news_with_cache(conn, symbol):
     """Get latest 5 news for the company using API call and cache
+       in the database
 
     Parameters
     ----------
+    conn
+        connection to the database
     symbol : str
         ticker symbol of the company
 
@@ -1023,63 +1429,65 @@ def get_news_with_cache(symbol):
     dict
         returned json
     """
-    cache_dict = open_cache(filename=NEWS_CACHE)
-    # if already cached
-    if symbol in cache_dict:
-        today = datetime.date.today()
-        update = cache_dict[symbol]["Fetched"]
-        update = datetime.datetime.strptime(update, '%Y-%m-%d').date()
-        delta = today - update
-        # if cache is old, get news again
-        if delta.days >= 1:
-            cache_dict[symbol] = get_news(symbol)
-            save_cache(cache_dict=cache_dict, filename=NEWS_CACHE)
-    # if never cached, get news
-    else:
-        cache_dict[symbol] = get_news(symbol)
-        save_cache(cache_dict=cache_dict, filename=NEWS_CACHE)
-    return cache_dict[symbol]
+    cur = conn.cursor()
+    # only a record fetched today is fresh
+    statement = """
+        SELECT Fetched, Payload
+        FROM News
+        WHERE Symbol = ? AND Fetched >= ?;
+    """
+    today = datetime.date.today().toordinal()
+    record = cur.execute(statement, [symbol, today]).fetchone()
+    # if cache is fresh, no need to get news again
+    if record is not None:
+        return {"Fetched": record[0], "News": orjson.loads(record[1])}
+    # if never cached or cache is old, get news
+    response = get_news(symbol)
+    with conn:
+        insert_news(conn, symbol, response["Fetched"], response["News"])
+    return response
 
 
 # Sample Cases ------------------------
 # sample_companies = ["AAPL", "BNTX"]
 # for company in sample_companies:
-#     get_news_with_cache(company)
+#     get_news_with_cache(conn, company)
 
 
 # Flask App -------------------------------------------------------------------
 
 # Helper funcs ------------------------
-def clean_dollar_to_float(value):
-    """Remove "$" signs and "," from string
+def clean_dollar_to_float(values):
+    """Remove "$" signs and "," from strings, and convert them to float
 
     Parameters
     ----------
-    value : str
-        value with "$" signs and "," (ex. $5,444.00)
+    values : pd.Series
+        values with "$" signs and "," (ex. $5,444.00)
 
     Returns
     -------
-    str
-        cleaned string
+    pd.Series
+        cleaned float values
     """
-    return (value.replace('$', '').replace(',', ''))
+    return (values.str.replace('$', '', regex=False)
+            .str.replace(',', '', regex=False).astype('float'))
 
 
-def clean_date_firstrade(datestr):
+def clean_date_firstrade(datestrs):
     """Format datetime of original CSV
 
     Parameters
     ----------
-    datestr : str
-        a string of the date in original format
+    datestrs : pd.Series
+        strings of the date in original format
 
     Returns
     -------
-    str
-        converted string of the date (i.e. 2020-01-01)
+    pd.Series
+        converted strings of the date (i.e. 2020-01-01)
     """
-    return datetime.datetime.strptime(datestr, '%m/%d/%Y').strftime('%Y-%m-%d')
+    return pd.to_datetime(datestrs, format='%m/%d/%Y').dt.strftime('%Y-%m-%d')
 
 
 def clean_firstrade(df):
@@ -1105,13 +1513,12 @@ def clean_firstrade(df):
         'Cost'
     ]]
     # clean gain/loss in string, and convert them to float
-    df['Sales'] = df['Sales Proceeds'].apply(clean_dollar_to_float).astype(
-        'float')
+    df['Sales'] = clean_dollar_to_float(df['Sales Proceeds'])
     df = df.drop(['Sales Proceeds'], axis=1)
-    df['Cost'] = df['Cost'].apply(clean_dollar_to_float).astype('float')
+    df['Cost'] = clean_dollar_to_float(df['Cost'])
     # clean datetime format
-    df['Date Acquired'] = df['Date Acquired'].apply(clean_date_firstrade)
-    df['Date Sold'] = df['Date Sold'].apply(clean_date_firstrade)
+    df['Date Acquired'] = clean_date_firstrade(df['Date Acquired'])
+    df['Date Sold'] = clean_date_firstrade(df['Date Sold'])
     return df
 
 
@@ -1139,71 +1546,132 @@ def convert_transaction_history(conn, df, broker, currency):
     if broker == "firstrade":
         df = clean_firstrade(df)
 
-    # get exchange rates of the selected currency
-    df['Rate Acquired'] = df.apply(lambda x: get_rates_with_cache(
-        conn=conn, currency=currency, date=x['Date Acquired']),
-                                   axis=1)
-    df['Rate Sold'] = df.apply(lambda x: get_rates_with_cache(
-        conn=conn, currency=currency, date=x['Date Sold']),
-                               axis=1)
-    df = df.round({'Rate Acquired': 2, 'Rate Sold': 2})
+    # get exchange rates of the selected currency (once per unique date)
+    rates = get_rates_map(conn=conn,
+                          currency=currency,
+                          dates=pd.concat([df['Date Acquired'],
+                                           df['Date Sold']]).tolist())
+    rate_acquired = df['Date Acquired'].map(rates).to_numpy(dtype=float)
+    rate_sold = df['Date Sold'].map(rates).to_numpy(dtype=float)
+    np.round(rate_acquired, 2, out=rate_acquired)
+    np.round(rate_sold, 2, out=rate_sold)
 
     # calculate gain/loss in the selected currency
-    df['Converted Cost'] = df['Cost'] * df['Rate Acquired']
-    df['Converted Sales'] = df['Sales'] * df['Rate Sold']
-    df = df.round({'Converted Cost': 2, 'Converted Sales': 2})
+    # (rounded in place on the arrays, instead of copying the frame)
+    converted_cost = df['Cost'].to_numpy() * rate_acquired
+    converted_sales = df['Sales'].to_numpy() * rate_sold
+    np.round(converted_cost, 2, out=converted_cost)
+    np.round(converted_sales, 2, out=converted_sales)
+    gain = np.subtract(converted_sales, converted_cost)
+    np.round(gain, 2, out=gain)
+
+    df['Rate Acquired'] = rate_acquired
+    df['Converted Cost'] = converted_cost
+    df['Rate Sold'] = rate_sold
+    df['Converted Sales'] = converted_sales
+    df['Gain&Loss'] = gain
 
     # arrange columns
     df = df[[
         'Symbol', 'Quantity', 'Date Acquired', 'Cost', 'Rate Acquired',
-        'Converted Cost', 'Date Sold', 'Sales', 'Rate Sold', 'Converted Sales'
+        'Converted Cost', 'Date Sold', 'Sales', 'Rate Sold', 'Converted Sales',
+        'Gain&Loss'
     ]]
 
-    # calculate gain/loss
-    df['Gain&Loss'] = df['Converted Sales'] - df['Converted Cost']
-    df = df.round({'Gain&Loss': 2})
-
     return df.sort_values(["Symbol", "Date Sold"])
 
 
-def gen_plot_cumulative_gain(df, currency, filename):
-    """Draw&save cumulative gain/loss plot
+# uploads already converted in this process (the rates never change)
+# (shared by the server threads, so changed only while holding the lock)
+CONVERTED_MEMO = {}
+CONVERTED_LOCK = threading.Lock()
+
+
+def convert_transaction_history_with_cache(conn, raw, broker, currency):
+    """Convert the transaction history uploaded by the user,
+       reusing the result when the same file was converted before
 
     Parameters
     ----------
     conn
-        connection to the server
+        connection to the database
+    raw : bytes
+        contents of the uploaded CSV file
+    broker : str
+        string indicating the brokeage firm the user is using
     currency : str
-        currency of choice
-    timestamp : str
-        timestamp indicating when this function called,
-        used for filenames in order to prevent browser cache
-    """
-    # remove existing plot
-    if glob.glob('images/cumulative*.png'):
-        for f in glob.glob("images/cumulative*.png"):
-            os.remove(f)
-
-    # find year
-    tax_year = df.iat[0, 2][:4]
+        string indicating the currency user want to convert to
 
-    # summing transactions by date
-    cum = df.groupby(by=["Date Sold"]).sum().sort_index()[['Gain&Loss']]
+    Returns
+    -------
+    str
+        sha256 of the file, identifying the upload
+    pd.DataFrame
+        cleaned and converted DataFrame
+    """
+    digest = hashlib.sha256(raw).hexdigest()
+    key = (digest, broker, currency)
+    with CONVERTED_LOCK:
+        converted = CONVERTED_MEMO.get(key)
+    if converted is None:
+        # the title row above the header makes every column text anyway,
+        # and the broker's cleaning function types them, so skip inference
+        # parse with the multithreaded Arrow reader when pyarrow is
+        # installed, and with the default parser otherwise
+        # (or when Arrow rejects the file)
+        try:
+            df = pd.read_csv(io.BytesIO(raw), dtype=str, engine="pyarrow")
+        except (ImportError, ValueError):
+            df = pd.read_csv(io.BytesIO(raw), dtype=str)
+        converted = convert_transaction_history(conn=conn,
+                                                df=df,
+                                                broker=broker,
+                                                currency=currency)
+        with CONVERTED_LOCK:
+            CONVERTED_MEMO[key] = converted
+            # keep only the latest 32 uploads
+            while len(CONVERTED_MEMO) > 32:
+                CONVERTED_MEMO.pop(next(iter(CONVERTED_MEMO)))
+    return digest, converted.copy()
 
-    # fill in empty dates
-    cum.index = pd.DatetimeIndex(cum.index)
-    all_dates = pd.date_range(start=f"{tax_year}-01-01",
-                              end=f"{tax_year}-12-31")
 
-    # calculate cumulative sum for all dates
-    cum = cum.reindex(all_dates).fillna(0.0).rename_axis('Date Sold').cumsum()
+def gen_plot_cumulative_gain(df, currency, filename):
+    """Draw&save cumulative gain/loss plot
+       (an existing plot with the same filename is reused)
 
-    # generate cumulative plot
-    cum_plot = sns.lineplot(data=cum, x="Date Sold", y="Gain&Loss")
-    cum_plot.set_title(f"Cumulative Gain and Loss in {tax_year} in {currency}")
-    cum_plot.set_xlabel('')
-    cum_plot.get_figure().savefig(f"images/{filename}")
-    plt.close()
+    Parameters
+    ----------
+    df : pd.DataFrame
+        converted DataFrame
+    currency : str
+        currency of choice
+    filename : str
+        filename of the plot in '/images'
+    """
+    # when never plotted
+    if not os.path.exists(f"images/{filename}"):
+        # find year
+        tax_year = df.iat[0, 2][:4]
+
+        # summing transactions by day, and filling in empty dates with 0
+        gains = df["Gain&Loss"].set_axis(pd.DatetimeIndex(df["Date Sold"]))
+        all_dates = pd.date_range(start=f"{tax_year}-01-01",
+                                  end=f"{tax_year}-12-31")
+        daily = gains.resample("D").sum().reindex(all_dates, fill_value=0.0)
+
+        # calculate cumulative sum for all dates
+        cum = daily.cumsum()
+
+        # generate cumulative plot
+        load_plotting()
+        with PLOT_LOCK:
+            CUM_AX.clear()
+            CUM_AX.plot(cum.index.to_numpy(), cum.to_numpy())
+            CUM_AX.set_title(
+                f"Cumulative Gain and Loss in {tax_year} in {currency}")
+            CUM_AX.set_xlabel('')
+            CUM_FIG.savefig(f"images/{filename}")
+    register_plot(filename)
 
 
 def output_csv(df):
@@ -1214,11 +1682,18 @@ def output_csv(df):
     df : pd.DataFrame
         DataFrame to be exported
     """
-    # remove existing plot
-    if os.path.exists("files/converted.csv"):
-        os.remove("files/converted.csv")
-    # save csv
-    df.to_csv('files/converted.csv')
+    # save csv next to the old one, then swap it in with a single rename
+    # (a download in progress never sees a half-written file, and
+    # each request writes its own temporary file, with the usual
+    # permissions of a new file)
+    tmp = f"files/converted.csv.{os.getpid()}-{threading.get_ident()}.tmp"
+    try:
+        df.to_csv(tmp)
+        os.replace(tmp, 'files/converted.csv')
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
 
 
 def clean_eps(eps):
@@ -1234,63 +1709,162 @@ def clean_eps(eps):
     pd.DataFrame
         cleaned DataFrame in long format
     """
-    # create dates column
-    dates = eps[['EPS1Date', 'EPS2Date', 'EPS3Date', 'EPS4Date']]
-    dates = dates.transpose().reset_index(drop=True)
-
-    # create reported eps column
+    # one value per quarter, in the same order for every column
+    dates = eps[['EPS1Date', 'EPS2Date', 'EPS3Date', 'EPS4Date']].to_numpy()
     reported = eps[[
         'EPS1Reported', 'EPS2Reported', 'EPS3Reported', 'EPS4Reported'
-    ]]
-    reported = reported.transpose().reset_index(drop=True)
-    reported['Type'] = 'Reported'
-    # join horizontally with dates
-    reported = pd.concat([reported, dates], axis=1, ignore_index=True)
-    reported = reported.rename(columns={0: "EPS", 1: "Type", 2: "Date"})
-
-    # create expected eps column
+    ]].to_numpy()
     expected = eps[[
-        'EPS1Expected', 'EPS2Expected', 'EPS3Expected', 'EPS4Reported'
-    ]]
-    expected = expected.transpose().reset_index(drop=True)
-    expected['Type'] = 'Expected'
-    # join horizontally with dates
-    expected = pd.concat([expected, dates], axis=1, ignore_index=True)
-    expected = expected.rename(columns={0: "EPS", 1: "Type", 2: "Date"})
-
-    # join vertically
-    return pd.concat([reported,
-                      expected]).sort_values(['Type',
-                                              'Date']).reset_index(drop=True)
-
-
-def gen_plot_eps(eps, symbol, timestamp):
+        'EPS1Expected', 'EPS2Expected', 'EPS3Expected', 'EPS4Expected'
+    ]].to_numpy()
+    # stack reported and expected vertically in long format
+    n = dates.size
+    df = pd.DataFrame({
+        "EPS": np.concatenate([reported.ravel(), expected.ravel()]),
+        "Type": ["Reported"] * n + ["Expected"] * n,
+        "Date": np.concatenate([dates.ravel(), dates.ravel()])
+    })
+    return df.sort_values(['Type', 'Date']).reset_index(drop=True)
+
+
+def gen_plot_eps(eps, symbol):
     """Draw&save EPS plot of the company
+       (an existing plot of the same data is reused)
 
     Parameters
     ----------
-    conn
-        connection to the server
+    eps : pd.DataFrame
+        EPS data in long format (see clean_eps)
     symbol : str
         ticker symbol of the company
-    timestamp : str
-        timestamp indicating when this function called,
-        used for filenames in order to prevent browser cache
+
+    Returns
+    -------
+    str
+        filename of the plot in '/images'
     """
-    if glob.glob('images/eps*.png'):
-        for f in glob.glob("images/eps*.png"):
-            os.remove(f)
-    eps_plot = sns.barplot(x="Date", y="EPS", hue="Type", data=eps)
-    eps_plot.set_title(
-        f"Consensus Earnings Estimates vs Reported for {symbol}")
-    eps_plot.get_figure().savefig(f"images/eps{timestamp}")
-    plt.close()
+    filename = gen_plot_filename(f"eps-{symbol}", eps)
+    # when data changed (or never plotted)
+    if not os.path.exists(f"images/{filename}"):
+        # one column per type, side by side for each quarter
+        wide = eps.groupby(['Date', 'Type'])['EPS'].mean().unstack()
+        wide = wide.reindex(columns=['Expected', 'Reported'])
+        x = np.arange(len(wide))
+        load_plotting()
+        with PLOT_LOCK:
+            EPS_AX.clear()
+            for offset, kind in [(-0.2, 'Expected'), (0.2, 'Reported')]:
+                EPS_AX.bar(x + offset, wide[kind].to_numpy(), 0.4,
+                           label=kind)
+            EPS_AX.set_xticks(x)
+            EPS_AX.set_xticklabels(wide.index)
+            EPS_AX.set_xlim(-0.5, len(wide) - 0.5)
+            EPS_AX.set_xlabel('Date')
+            EPS_AX.set_ylabel('EPS')
+            EPS_AX.legend(title='Type')
+            EPS_AX.set_title(
+                f"Consensus Earnings Estimates vs Reported for {symbol}")
+            EPS_FIG.savefig(f"images/{filename}")
+    register_plot(filename)
+    return filename
 
 
 # App ------------------------
 app = Flask(__name__, static_url_path="", static_folder="images")
 
 
+def get_conn():
+    """Get the database connection of the current request,
+       opening one on first use
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    sqlite3.Connection
+        connection to database
+    """
+    if "conn" not in g:
+        g.conn = connect_db(DB)
+    return g.conn
+
+
+@app.teardown_appcontext
+def close_conn(exception):
+    conn = g.pop("conn", None)
+    if conn is not None:
+        conn.close()
+
+
+# threads for the independent API calls of a page
+# (kept alive, so that each keeps its own connection across requests)
+FETCH_POOL = ThreadPoolExecutor(max_workers=4)
+# one connection per FETCH_POOL thread
+LOCAL = threading.local()
+
+
+def get_worker_conn():
+    """Get the database connection of the current FETCH_POOL thread,
+       opening one on first use
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    sqlite3.Connection
+        connection to database
+    """
+    if not hasattr(LOCAL, "conn"):
+        LOCAL.conn = connect_db(DB)
+    return LOCAL.conn
+
+
+def run_with_conn(func, *args):
+    """Call a function taking a database connection first,
+       with the connection of the current FETCH_POOL thread
+
+    Parameters
+    ----------
+    func
+        function called as func(conn, *args)
+    args
+        the rest of the arguments
+
+    Returns
+    -------
+    any
+        the value returned by the function
+    """
+    return func(get_worker_conn(), *args)
+
+
+def get_company_report_with_cache(conn, symbol: str):
+    """Get company info and draw EPS plot of the company
+       (EPS records reference Companies, so the company goes first)
+
+    Parameters
+    ----------
+    conn
+        connection to the database
+    symbol : str
+        ticker symbol of the company
+
+    Returns
+    -------
+    list
+        records of the company info
+    str
+        filename of the EPS plot in '/images'
+    """
+    info_dict = get_company_info_with_cache(conn, symbol).to_dict('records')
+    eps = clean_eps(get_eps_with_cache(conn, symbol))
+    return info_dict, gen_plot_eps(eps=eps, symbol=symbol)
+
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -1298,61 +1872,61 @@ def index():
 
 @app.route('/converted', methods=['POST'])
 def converted():
-    conn = sqlite3.connect(DB)
+    conn = get_conn()
     # get constants
-    df = pd.read_csv(request.files.get('file'))
+    raw = request.files.get('file').read()
     broker = request.form['brokerage']
     currency = request.form['currency']
-    # convert
-    df = convert_transaction_history(conn=conn,
-                                     df=df,
-                                     broker=broker,
-                                     currency=currency)
-    # generate plot in '/images'
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d-%H:%M:%S")
-    filename = f"cumulative{timestamp}.png"  # prevent browser cache
+    # convert (unless the same file was converted before)
+    digest, df = convert_transaction_history_with_cache(conn=conn,
+                                                        raw=raw,
+                                                        broker=broker,
+                                                        currency=currency)
+    # generate plot in '/images', named after the upload
+    # (a repeated upload reuses the plot, a new one gets a new name)
+    filename = f"cumulative-{broker}-{currency}-{digest[:16]}.png"
     gen_plot_cumulative_gain(df=df, currency=currency, filename=filename)
     # generate converted csv in '/files'
     output_csv(df)
-    # prepare HTML table
-    df_dict = df.to_dict('records')
+    # prepare HTML table (rows are streamed to the template as tuples)
+    rows = df[[
+        'Symbol', 'Quantity', 'Date Acquired', 'Converted Cost', 'Date Sold',
+        'Converted Sales', 'Gain&Loss'
+    ]].itertuples(index=False, name=None)
     return render_template('converted.html',
-                           df_dict=df_dict,
+                           rows=rows,
                            currency=currency,
                            filename=filename)
 
 
 @app.route('/analysis/<symbol>')
 def symbol(symbol):
-    conn = sqlite3.connect(DB)
-    # get timestamp for plots (prevent browser cache)
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d-%H:%M:%S")
+    conn = get_conn()
     # show plots of the latest tax year
     year = str(datetime.date.today().year - 1)
     # check if the symbol is an ETF
-    etfs = get_all_ETFs_with_cache(conn)
-    WHETHER_ETF = etfs.Symbol.isin([symbol]).any()
+    etf_records = get_ETF_records_with_cache(conn)
+    WHETHER_ETF = symbol in etf_records
+    # the API calls below are independent, so make them concurrently
     # get info to display
-    news_dict = get_news_with_cache(symbol)
+    news = FETCH_POOL.submit(run_with_conn, get_news_with_cache, symbol)
     # draw time series plot
-    gen_plot_history(conn=conn, symbol=symbol, year=year, timestamp=timestamp)
-    history_filename = f"history{timestamp}.png"
+    # (plots are named after their data, so the browser never shows
+    # an outdated one)
+    history = FETCH_POOL.submit(run_with_conn, gen_plot_history, symbol, year)
     # for an ETF, we only display basic info
     if WHETHER_ETF:
         # get basic info
-        info_dict = etfs[etfs['Symbol'] == symbol].to_dict('records')
+        info_dict = [etf_records[symbol]]
         # ignore EPS
-        eps = "Not Applicable"
         eps_filename = "Not Applicable"
     # for a company, we display more detailed info
     elif not WHETHER_ETF:
-        # get basic info
-        info_dict = get_company_info_with_cache(conn, symbol).to_dict('records')
-        # draw EPS plot
-        eps = get_eps_with_cache(conn, symbol)
-        eps = clean_eps(eps)
-        gen_plot_eps(eps=eps, symbol=symbol, timestamp=timestamp)
-        eps_filename = f"eps{timestamp}.png"
+        # get basic info, and draw EPS plot
+        # (on this thread, so that a page holds at most two pool threads)
+        info_dict, eps_filename = get_company_report_with_cache(conn, symbol)
+    news_dict = news.result()
+    history_filename = history.result()
     return render_template('symbol.html',
                            symbol=symbol,
                            year=year,